@@ -1,5 +1,12 @@
+import csv
+import multiprocessing
+import os
+import time
 from abc import abstractmethod
-from typing import NamedTuple
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, nullcontext
+from typing import BinaryIO, Callable, NamedTuple
 
 import pygame
 
@@ -20,7 +27,67 @@ class Point(NamedTuple):
         return f'({self.x},{self.y})'
 
 
+class FrameTimings:
+    """
+    How long each named phase took on every frame, in nanoseconds.
+
+    Rolling percentiles are kept over the most recent frames. Every frame is
+    only kept if asked for, for writing to a CSV, as it grows for as long as
+    the animation runs.
+    """
+
+    def __init__(self, window=300, keep_frames=False):
+        self.names: list[str] = []
+        self.current: dict[str, int] = defaultdict(int)
+        self.keep_frames = keep_frames
+        self.frames: list[dict[str, int]] = []
+        self.recent: dict[str, deque[int]] = defaultdict(lambda: deque(maxlen=window))
+
+    @contextmanager
+    def time(self, name: str):
+        if name not in self.names:
+            self.names.append(name)
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.current[name] += time.perf_counter_ns() - start
+
+    def end_frame(self):
+        for name in self.names:
+            self.recent[name].append(self.current[name])
+        if self.keep_frames:
+            self.frames.append(dict(self.current))
+        self.current.clear()
+
+    def percentile(self, name: str, p: float) -> int:
+        values = sorted(self.recent[name])
+        if not values:
+            return 0
+        return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+    def write_csv(self, filename: str):
+        if not self.keep_frames:
+            raise ValueError('Frames were not kept, so there is nothing to write')
+        with open(filename, 'w', newline='') as f:
+            writer = csv.DictWriter(f, ['frame', *self.names], restval=0)
+            writer.writeheader()
+            for i, frame in enumerate(self.frames):
+                writer.writerow({'frame': i, **frame})
+
+
 class Model:
+    finished = False
+    # Set if render depends only on the state from snapshot, so frames can be rendered in other processes
+    parallel_render = False
+    timings: FrameTimings = None
+
+    def timer(self, name: str):
+        """Time a phase of the model under its own name, when run by an Animation"""
+        if self.timings is None:
+            return nullcontext()
+        return self.timings.time(name)
+
     @abstractmethod
     def update(self):
         pass
@@ -29,6 +96,64 @@ class Model:
     def render(self, surface: pygame.Surface):
         pass
 
+    def render_background(self, surface: pygame.Surface) -> bool:
+        """
+        Optionally draw the parts of the model that never change, which are then cached.
+
+        :return: Whether the model supports dirty rectangles. If it does, the
+                 background is restored under each rect from dirty_rects before
+                 every render, and render only needs to redraw those areas.
+        """
+        return False
+
+    def dirty_rects(self) -> list[pygame.Rect] | None:
+        """The areas that changed since the last render, or None if everything needs redrawing"""
+        return None
+
+    def invalidate(self):
+        """Make the next render redraw everything"""
+        pass
+
+    def snapshot(self):
+        """
+        Capture the model's state, so it can be restored later to seek.
+
+        :return: Any object that restore accepts, or None if snapshots aren't supported
+        """
+        return None
+
+    def restore(self, state):
+        """Put the model back into a state returned by snapshot"""
+        raise NotImplementedError
+
+
+# Each render worker process builds its own copy of the model and a surface to render it onto
+_render_model: Model = None  # noqa
+_render_surface: pygame.Surface = None  # noqa
+
+
+def _start_render_worker(factory: Callable[[], Model], size: tuple[int, int]):
+    global _render_model, _render_surface
+    os.environ['SDL_VIDEODRIVER'] = 'dummy'
+    pygame.init()
+    _render_model = factory()
+    _render_surface = pygame.Surface(size, flags=pygame.SRCALPHA)
+
+
+def _render_snapshot(state, filename: str = None) -> bytes | None:
+    """
+    Render a snapshot in a worker process.
+
+    :param filename: Save the frame to this PNG file. Otherwise, return its raw RGB bytes.
+    """
+    _render_model.restore(state)
+    _render_surface.fill(0xFFFFFF)
+    _render_model.render(_render_surface)
+    if filename is not None:
+        pygame.image.save(_render_surface, filename)
+        return None
+    return pygame.image.tobytes(_render_surface, 'RGB')
+
 
 def is_quit(event: pygame.event.Event):
     if event.type == pygame.QUIT:
@@ -39,32 +164,304 @@ def is_quit(event: pygame.event.Event):
 
 
 class Animation:
-    def __init__(self, caption=None, size=(800, 800), fps=60):
+    # Most renders that can be skipped in a row when the simulation falls behind
+    MAX_SKIPPED_RENDERS = 5
+
+    def __init__(self, caption=None, size=(800, 800), fps=60, headless=False, tick_rate=None, timings_file=None,
+                 checkpoint_interval=100, max_checkpoints=100):
+        """
+        :param fps: Frames to display per second
+        :param tick_rate: Model updates per second at normal speed, defaulting to one per frame
+        :param timings_file: Write the time spent in each phase of each frame to this CSV when the run ends
+        :param checkpoint_interval: Ticks between snapshots of the model, for seeking
+        :param max_checkpoints: Most snapshots to keep, besides the initial one. The oldest are dropped first.
+        """
+        if headless:
+            # Must be set before pygame.init
+            os.environ['SDL_VIDEODRIVER'] = 'dummy'
         pygame.init()
-        self.window = pygame.display.set_mode(size, flags=pygame.SRCALPHA)
-        if caption is not None:
-            pygame.display.set_caption(caption)
-        pygame.display.set_icon(pygame.image.load('assets/aoc_favicon.png'))
+        if headless:
+            self.window = pygame.Surface(size, flags=pygame.SRCALPHA)
+        else:
+            self.window = pygame.display.set_mode(size, flags=pygame.SRCALPHA)
+            if caption is not None:
+                pygame.display.set_caption(caption)
+            pygame.display.set_icon(pygame.image.load('assets/aoc_favicon.png'))
         self.clock = pygame.time.Clock()
         self.model: Model = None  # noqa
         self.fps = fps
+        self.tick_rate = tick_rate or fps
+        self.speed = 1.0
+        self.timings = FrameTimings(keep_frames=timings_file is not None)
+        self.timings_file = timings_file
+        self.show_timings = False
+        self.timings_font: pygame.font.Font | None = None
+        self.background: pygame.Surface | None = None
+        self.tick = 0
+        self.checkpoint_interval = checkpoint_interval
+        self.initial_state = None
+        self.checkpoints: deque[tuple[int, object]] = deque(maxlen=max_checkpoints)
 
     def update(self):
         self.model.update()
+        self.tick += 1
+        if self.initial_state is not None and self.tick % self.checkpoint_interval == 0:
+            # After seeking backwards, later checkpoints are still valid as the model is deterministic
+            if not self.checkpoints or self.checkpoints[-1][0] < self.tick:
+                self.checkpoints.append((self.tick, self.model.snapshot()))
+
+    def seek(self, tick: int):
+        """
+        Restore the latest checkpoint at or before the tick, then update up to it without rendering.
+
+        Does nothing if the model doesn't support snapshots.
+        """
+        if self.initial_state is None:
+            return
+        tick = max(tick, 0)
+        checkpoint_tick, state = 0, self.initial_state
+        for checkpoint in self.checkpoints:
+            if checkpoint[0] > tick:
+                break
+            checkpoint_tick, state = checkpoint
+        # Fast-forward from the current tick instead if it's closer
+        if not checkpoint_tick <= self.tick <= tick:
+            self.model.restore(state)
+            self.tick = checkpoint_tick
+        while self.tick < tick and not self.model.finished:
+            self.update()
+        self.model.invalidate()
 
     def render(self):
-        self.window.fill(0xFFFFFF)
+        """
+        Render the model.
+
+        :return: The areas of the window that changed, or None if it all did
+        """
+        if self.background is None:
+            self.window.fill(0xFFFFFF)
+            self.model.render(self.window)
+            return None
+        if self.show_timings:
+            # The overlay covers part of the window, which has to be restored
+            self.model.invalidate()
+        rects = self.model.dirty_rects()
+        # Clear then add, as a plain blit would blend translucent background pixels instead of copying them
+        for rect in [self.window.get_rect()] if rects is None else rects:
+            self.window.fill((0, 0, 0, 0), rect)
+            self.window.blit(self.background, rect, rect, special_flags=pygame.BLEND_RGBA_ADD)
         self.model.render(self.window)
+        return rects
 
-    def run(self, model: Model):
+    def set_model(self, model: Model):
         self.model = model
+        model.timings = self.timings
+        background = pygame.Surface(self.window.get_size(), flags=pygame.SRCALPHA)
+        background.fill(0xFFFFFF)
+        self.background = background if model.render_background(background) else None
+        self.tick = 0
+        self.checkpoints.clear()
+        self.initial_state = model.snapshot()
+
+    def handle_event(self, event: pygame.event.Event):
+        if event.type != pygame.KEYDOWN:
+            return
+        if event.key in (pygame.K_PLUS, pygame.K_EQUALS, pygame.K_KP_PLUS):
+            self.speed *= 2
+        elif event.key in (pygame.K_MINUS, pygame.K_KP_MINUS):
+            self.speed /= 2
+        elif event.key == pygame.K_0:
+            self.speed = 1.0
+        elif event.key == pygame.K_F3:
+            self.show_timings = not self.show_timings
+        elif event.key in (pygame.K_LEFT, pygame.K_RIGHT):
+            # Scrub by a checkpoint, or ten with shift held
+            jump = self.checkpoint_interval * (10 if event.mod & pygame.KMOD_SHIFT else 1)
+            self.seek(self.tick + (jump if event.key == pygame.K_RIGHT else -jump))
+        elif event.key == pygame.K_HOME:
+            self.seek(0)
+
+    def render_timings(self):
+        """Draw the rolling percentiles of each phase over the top left of the window"""
+        if self.timings_font is None:
+            self.timings_font = pygame.font.SysFont('Courier', 14)
+        font = self.timings_font
+        width = max(map(len, ['phase', *self.timings.names]))
+        lines = [f'{"phase":<{width}}' + ''.join(f'{p:>8}' for p in ('p50', 'p95', 'p99')) + ' (ms)'] + [
+            f'{name:<{width}}' + ''.join(f'{self.timings.percentile(name, p) / 1e6:8.2f}' for p in (50, 95, 99))
+            for name in self.timings.names
+        ]
+        texts = [font.render(line, True, (255, 255, 255)) for line in lines]
+        height = sum(text.get_height() for text in texts)
+        backdrop = pygame.Surface((max(text.get_width() for text in texts) + 10, height + 10), pygame.SRCALPHA)
+        backdrop.fill((0, 0, 0, 180))
+        y = 5
+        for text in texts:
+            backdrop.blit(text, (5, y))
+            y += text.get_height()
+        self.window.blit(backdrop, (0, 0))
+
+    def run(self, model: Model):
+        """
+        Run the model with a fixed timestep.
+
+        The model is updated tick_rate * speed times per second of real time,
+        however long rendering takes. When the updates for a frame use up the
+        frame's time budget, rendering is skipped (a few frames at most) so the
+        simulation can catch up.
+        """
+        self.set_model(model)
         running = True
+        frame_budget = 1 / self.fps
+        lag = 0.0
+        skipped_renders = 0
+        previous = time.perf_counter()
         while running:
             for event in pygame.event.get():
                 if is_quit(event):
                     running = False
-            self.update()
-            self.render()
-            pygame.display.update()
+                self.handle_event(event)
+            frame_start = time.perf_counter()
+            step = 1 / self.tick_rate
+            lag += (frame_start - previous) * self.speed
+            previous = frame_start
+            with self.timings.time('update'):
+                while lag >= step and time.perf_counter() - frame_start < frame_budget:
+                    self.update()
+                    lag -= step
+            # Don't let a backlog the model can't keep up with grow forever
+            lag = min(lag, self.speed / 4)
+            if time.perf_counter() - frame_start < frame_budget or skipped_renders >= self.MAX_SKIPPED_RENDERS:
+                with self.timings.time('render'):
+                    rects = self.render()
+                if self.show_timings:
+                    self.render_timings()
+                    rects = None
+                with self.timings.time('display'):
+                    if rects is None:
+                        pygame.display.update()
+                    elif rects:
+                        pygame.display.update(rects)
+                skipped_renders = 0
+            else:
+                skipped_renders += 1
+            self.timings.end_frame()
             self.clock.tick(self.fps)
         pygame.quit()
+        if self.timings_file is not None:
+            self.timings.write_csv(self.timings_file)
+
+    def export(self, model: Model, frames: int = None, output: str | BinaryIO = None):
+        """
+        Step and render the model as fast as possible, with no frame limit, and save each frame.
+
+        This is meant for headless animations, but works with a window too.
+
+        :param frames: Stop after this many frames. Otherwise, run until the model is finished.
+        :param output: Either a filename pattern for a PNG sequence, such as 'frames/{:05}.png',
+                       or a binary stream (e.g. a video encoder's stdin) to write raw RGB frames to.
+                       If not given, frames are rendered and discarded.
+        :return: The frames per second achieved
+        """
+        self.set_model(model)
+        rendered = 0
+        start = time.perf_counter()
+        while (frames is None or rendered < frames) and not model.finished:
+            with self.timings.time('update'):
+                self.update()
+            with self.timings.time('render'):
+                self.render()
+            with self.timings.time('save'):
+                if isinstance(output, str):
+                    pygame.image.save(self.window, output.format(rendered))
+                elif output is not None:
+                    output.write(pygame.image.tobytes(self.window, 'RGB'))
+            self.timings.end_frame()
+            rendered += 1
+        elapsed = time.perf_counter() - start
+        pygame.quit()
+        if self.timings_file is not None:
+            self.timings.write_csv(self.timings_file)
+        fps = rendered / elapsed if elapsed else float('inf')
+        print(f'Exported {rendered} frames in {elapsed:.2f}s ({fps:.1f} fps)')
+        return fps
+
+    def export_parallel(self, factory: Callable[[], Model], frames: int = None, output: str | BinaryIO = None,
+                        workers: int = None):
+        """
+        Like export, but only update the model here, rendering snapshots of it in a pool of processes.
+
+        Falls back to export for models without parallel_render set.
+
+        :param factory: Builds the model. Each worker calls it too, so it must be picklable,
+                        e.g. a module-level function or a functools.partial of one.
+        :param workers: Number of processes to render in, defaulting to the number of CPUs
+        :return: The frames per second achieved
+        """
+        model = factory()
+        if not model.parallel_render:
+            return self.export(model, frames, output)
+        self.set_model(model)
+        workers = workers or os.cpu_count()
+        # Enough frames in flight to keep every worker busy, without piling up unwritten frames
+        pending = deque()
+        max_pending = 4 * workers
+
+        def write_next():
+            frame = pending.popleft().result()
+            if frame is not None and output is not None:
+                output.write(frame)
+
+        rendered = 0
+        start = time.perf_counter()
+        # Spawn rather than fork, so workers don't inherit this process's display
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_start_render_worker,
+                                 initargs=(factory, self.window.get_size())) as pool:
+            while (frames is None or rendered < frames) and not model.finished:
+                with self.timings.time('update'):
+                    self.update()
+                    state = model.snapshot()
+                filename = output.format(rendered) if isinstance(output, str) else None
+                pending.append(pool.submit(_render_snapshot, state, filename))
+                rendered += 1
+                if len(pending) >= max_pending:
+                    with self.timings.time('save'):
+                        write_next()
+                self.timings.end_frame()
+            with self.timings.time('save'):
+                while pending:
+                    write_next()
+        elapsed = time.perf_counter() - start
+        pygame.quit()
+        if self.timings_file is not None:
+            self.timings.write_csv(self.timings_file)
+        fps = rendered / elapsed if elapsed else float('inf')
+        print(f'Exported {rendered} frames with {workers} workers in {elapsed:.2f}s ({fps:.1f} fps)')
+        return fps
+
+
+def benchmark_export(factory: Callable[[], Model], frames=500, size=(800, 800), worker_counts=None):
+    """
+    Time exporting raw frames of a model with different numbers of render processes.
+
+    Zero workers means a plain export in this process, for comparison.
+
+    :param worker_counts: Defaults to 0, 1, 2, 4... up to the number of CPUs
+    :return: {workers: frames per second}
+    """
+    if worker_counts is None:
+        cpus = os.cpu_count()
+        worker_counts = [0] + [2 ** i for i in range(cpus.bit_length()) if 2 ** i < cpus] + [cpus]
+    results = {}
+    with open(os.devnull, 'wb') as output:
+        for workers in worker_counts:
+            animation = Animation(size=size, headless=True)
+            if workers:
+                results[workers] = animation.export_parallel(factory, frames, output, workers=workers)
+            else:
+                results[workers] = animation.export(factory(), frames, output)
+    print('Workers  Frames/s  Speedup')
+    for workers, fps in results.items():
+        print(f'{workers:>7}  {fps:>8.1f}  {fps / results[worker_counts[0]]:>6.2f}x')
+    return results
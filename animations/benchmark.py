@@ -0,0 +1,151 @@
+"""
+Measure how fast each animation model simulates, calling only update, with no window or rendering.
+
+Run from this directory, like the animations themselves, e.g.
+
+    python benchmark.py --ticks 5000 --output benchmarks.jsonl
+
+Each result is printed, and appended to the output file as a line of JSON
+tagged with the commit, so runs from different commits can be compared.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+from typing import Callable
+
+import pygame
+
+from animations import Model
+
+
+def bathroom_security(filename):
+    from animations.day14 import BathroomSecurity
+    return BathroomSecurity(filename)
+
+
+def warehouse(filename):
+    from animations.day15 import Warehouse, parse
+    return Warehouse(*parse(filename, expand=True))
+
+
+def grid(filename):
+    from animations.day18 import Grid
+    return Grid(filename, 71, init_read=1024)
+
+
+def logic_system(filename):
+    from animations.day24 import LogicSystem
+    return LogicSystem().load(filename)
+
+
+def garden_map(filename):
+    from animations.day12 import Map
+    return Map(filename)
+
+
+def network(filename):
+    from animations.day23 import Network
+    model = Network.from_connections(filename)
+    # The layout only starts moving once scattered, which normally happens on the first render
+    random.seed(0)
+    model.scatter(pygame.Surface((800, 800)))
+    return model
+
+
+# Model name: (input file, function to build the model from it)
+MODELS: dict[str, tuple[str, Callable[[str], Model]]] = {
+    'BathroomSecurity': ('../inputs/day14.txt', bathroom_security),
+    'Warehouse': ('../inputs/day15.txt', warehouse),
+    'Grid': ('../inputs/day18.txt', grid),
+    'LogicSystem': ('../inputs/day24.txt', logic_system),
+    'Map': ('../inputs/day12.txt', garden_map),
+    'Network': ('../inputs/day23.txt', network),
+}
+
+
+def run_ticks(model: Model, ticks: int) -> int:
+    """
+    Update the model up to the given number of ticks, stopping early if it finishes.
+
+    :return: The number of ticks run
+    """
+    for tick in range(ticks):
+        if model.finished:
+            return tick
+        model.update()
+    return ticks
+
+
+def current_commit():
+    """The commit hash of the working tree, marked if tracked files have uncommitted changes"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'diff', '--quiet', 'HEAD']).returncode != 0
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + '-dirty' if dirty else commit
+
+
+def benchmark(name: str, ticks: int = 1000) -> dict:
+    """
+    Time updating a model, then measure its peak memory in a second run, so tracing doesn't slow the timed one.
+
+    :param ticks: Most ticks to run. Models that finish sooner stop there.
+    :return: The results, ready to be saved as JSON
+    """
+    filename, build = MODELS[name]
+    # Some models print as they go, which would bury the results
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        model = build(filename)
+        start = time.perf_counter()
+        ran = run_ticks(model, ticks)
+        elapsed = time.perf_counter() - start
+
+        tracemalloc.start()
+        run_ticks(build(filename), ticks)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return {
+        'model': name,
+        'commit': current_commit(),
+        'python': platform.python_version(),
+        'ticks': ran,
+        'finished': model.finished,
+        'seconds': elapsed,
+        'ticks_per_second': ran / elapsed if elapsed else None,
+        'peak_memory_kib': peak // 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('models', nargs='*', default=list(MODELS),
+                        help=f'Models to benchmark, defaulting to all of them: {", ".join(MODELS)}')
+    parser.add_argument('--ticks', type=int, default=1000, help='Most ticks to run each model for')
+    parser.add_argument('--output', help='Append the results to this JSON lines file')
+    args = parser.parse_args()
+    if unknown := set(args.models) - set(MODELS):
+        parser.error(f'Unknown models: {", ".join(sorted(unknown))}')
+
+    print(f'{"Model":<16}  {"Ticks":>6}  {"Ticks/s":>10}  {"Peak KiB":>9}')
+    for name in args.models:
+        filename = MODELS[name][0]
+        if not os.path.exists(filename):
+            print(f'{name:<16}  skipped, {filename} is missing')
+            continue
+        result = benchmark(name, args.ticks)
+        print(f'{name:<16}  {result["ticks"]:>6}  {result["ticks_per_second"] or 0:>10.1f}  '
+              f'{result["peak_memory_kib"]:>9}')
+        if args.output:
+            with open(args.output, 'a') as f:
+                f.write(json.dumps(result) + '\n')
+
+
+if __name__ == '__main__':
+    main()
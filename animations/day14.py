@@ -1,40 +1,17 @@
 import os.path
 import re
 import sys
-from collections import defaultdict
 from dataclasses import dataclass
-from enum import Enum, auto
-from functools import reduce
-from statistics import variance
+from functools import partial
+from math import gcd
+from typing import Iterable
 
+import numpy as np
 import pygame
 from pygame import Vector2
 from pygame.colordict import THECOLORS
 
-from animations import Model, Point, Animation
-
-
-def wrap(value: Point, size: tuple[int, int]):
-    xsize, ysize = size
-    if value.x in range(xsize) and value.y in range(ysize):
-        return value
-    x, y = value
-    while x >= xsize:
-        x -= xsize
-    while x < 0:
-        x += xsize
-    while y >= ysize:
-        y -= ysize
-    while y < 0:
-        y += ysize
-    return Point(x, y)
-
-
-class Quadrant(Enum):
-    NW = auto()
-    NE = auto()
-    SW = auto()
-    SE = auto()
+from animations import Model, Point, Animation, benchmark_export
 
 
 @dataclass
@@ -42,47 +19,115 @@ class Robot:
     pos: Point
     vel: Point
 
-    def move(self, bounds: Point | tuple[int, int]):
-        self.pos += self.vel
-        self.pos = wrap(self.pos, bounds)
+
+class RobotStore:
+    """
+    Robot starting positions and velocities as arrays, giving where the robots are at any time directly,
+    as (p + v*t) mod size.
+
+    Methods taking a range of times evaluate it in blocks, to bound memory use.
+    """
+    BLOCK_SIZE = 1024
+
+    def __init__(self, robots: list[Robot], size: tuple[int, int]):
+        self.start = np.array([robot.pos for robot in robots], dtype=np.int64).reshape(-1, 2)
+        self.vel = np.array([robot.vel for robot in robots], dtype=np.int64).reshape(-1, 2)
+        self.size = np.array(size, dtype=np.int64)
+
+    def positions(self, t: int) -> np.ndarray:
+        """:return: An array of (x, y) for each robot at time t"""
+        return (self.start + self.vel * t) % self.size
+
+    def positions_over(self, times: np.ndarray) -> np.ndarray:
+        """:return: An array of shape (times, robots, 2)"""
+        return (self.start + self.vel * times[:, None, None]) % self.size
+
+    def _evaluate(self, times: Iterable[int], func) -> np.ndarray:
+        times = np.fromiter(times, dtype=np.int64)
+        return np.concatenate([
+            func(self.positions_over(times[i:i + self.BLOCK_SIZE]))
+            for i in range(0, len(times), self.BLOCK_SIZE)
+        ] or [np.empty((0, 2))])
+
+    def variances(self, times: Iterable[int]) -> np.ndarray:
+        """:return: The sample variance of the x and y positions at each time, with shape (times, 2)"""
+        return self._evaluate(times, lambda positions: positions.var(axis=1, ddof=1))
+
+    def safety_factors(self, times: Iterable[int]) -> np.ndarray:
+        """:return: The product of the number of robots in each quadrant at each time"""
+        x_mid, y_mid = self.size // 2
+
+        def quadrant_product(positions):
+            xs, ys = positions[..., 0], positions[..., 1]
+            quadrants = [
+                (xs < x_mid) & (ys < y_mid),
+                (xs > x_mid) & (ys < y_mid),
+                (xs < x_mid) & (ys > y_mid),
+                (xs > x_mid) & (ys > y_mid),
+            ]
+            return np.prod([quadrant.sum(axis=1) for quadrant in quadrants], axis=0)
+
+        return self._evaluate(times, quadrant_product)
+
+
+def crt(a: int, m: int, b: int, n: int) -> int | None:
+    """
+    Solve t = a (mod m) and t = b (mod n) with the Chinese remainder theorem.
+
+    :return: The smallest non-negative t, or None if there's no solution
+    """
+    g = gcd(m, n)
+    if (b - a) % g:
+        return None
+    k = (b - a) // g * pow(m // g, -1, n // g) % (n // g)
+    return (a + m * k) % (m // g * n)
+
+
+def find_tree_time(store: RobotStore, thresholds=(500, 500)) -> int | None:
+    """
+    Find when the robots are most tightly grouped, which is when they form the tree.
+
+    The x positions repeat every width ticks and the y positions every height ticks,
+    so each axis only needs checking over one period. The times with the least
+    variance on each axis are then combined with the Chinese remainder theorem.
+
+    :param thresholds: Most x and y variance for the robots to count as grouped
+    :return: The time, or None if the robots never group on both axes
+    """
+    width, height = store.size.tolist()
+    x_variances = store.variances(range(width))[:, 0]
+    y_variances = store.variances(range(height))[:, 1]
+    x_time = int(np.argmin(x_variances))
+    y_time = int(np.argmin(y_variances))
+    x_threshold, y_threshold = thresholds
+    if x_variances[x_time] >= x_threshold or y_variances[y_time] >= y_threshold:
+        return None
+    return crt(x_time, width, y_time, height)
 
 
 class BathroomSecurity(Model):
-    def __init__(self, robots: str, size=(101, 103)):
+    parallel_render = True
+
+    def __init__(self, robots: str, size=(101, 103), tree_variance=(500, 500)):
+        """
+        :param tree_variance: Most x and y variance in the robots' positions for them to count as a tree
+        """
         self.robots = list(self.parse_input(robots))
         self.size = Point(*size)
+        self.store = RobotStore(self.robots, self.size)
+        self.tree_time = find_tree_time(self.store, tree_variance)
         self.elapsed_time = 0
         self.pause_frames = 0
         self.part1 = self.part2 = 0
 
-    def is_likely_tree(self):
-        xs = [robot.pos.x for robot in self.robots]
-        ys = [robot.pos.y for robot in self.robots]
-        xv = variance(xs)
-        yv = variance(ys)
-
-        # if xv < 500:
-        #     print(f'X variance at {self.elapsed_time}: {xv}')
-        # if yv < 500:
-        #     print(f'Y variance at {self.elapsed_time}: {yv}')
-        return xv < 500 and yv < 500
-
     def get_safety_factor(self):
-        x_mid = self.size.x // 2
-        y_mid = self.size.y // 2
-        quadrants = defaultdict(int)
-        for robot in self.robots:
-            if robot.pos.x < x_mid:
-                if robot.pos.y < y_mid:
-                    quadrants[Quadrant.NW] += 1
-                if robot.pos.y > y_mid:
-                    quadrants[Quadrant.SW] += 1
-            if robot.pos.x > x_mid:
-                if robot.pos.y < y_mid:
-                    quadrants[Quadrant.NE] += 1
-                if robot.pos.y > y_mid:
-                    quadrants[Quadrant.SE] += 1
-        return reduce(int.__mul__, quadrants.values(), 1)
+        return int(self.store.safety_factors([self.elapsed_time])[0])
+
+    def set_time(self, t: int):
+        """Jump straight to the robots' positions at time t"""
+        self.elapsed_time = t
+        for robot, (x, y) in zip(self.robots, self.store.positions(t).tolist()):
+            robot.pos = Point(x, y)
 
     @staticmethod
     def parse_input(robots: str):
@@ -97,16 +142,22 @@ class BathroomSecurity(Model):
         if self.pause_frames:
             self.pause_frames -= 1
             return
-        self.elapsed_time += 1
-        for robot in self.robots:
-            robot.move(self.size)
+        self.set_time(self.elapsed_time + 1)
         if self.elapsed_time == 100:
             self.part1 = self.get_safety_factor()
             self.pause_frames = 120
-        if self.is_likely_tree():
+        if self.elapsed_time == self.tree_time:
             self.part2 = self.elapsed_time
             self.pause_frames = sys.maxsize
 
+    def snapshot(self):
+        # Positions follow from the time
+        return self.elapsed_time, self.pause_frames, self.part1, self.part2
+
+    def restore(self, state):
+        time, self.pause_frames, self.part1, self.part2 = state
+        self.set_time(time)
+
     def render(self, surface: pygame.Surface):
         avail_height = surface.get_height()
         num_tiles = self.size.y
@@ -132,8 +183,23 @@ class BathroomSecurity(Model):
 
 
 
+def benchmark_parallel_export(filename='../inputs/day14.txt', frames=500):
+    """Time exporting the robots' frames with different numbers of render processes"""
+    return benchmark_export(partial(BathroomSecurity, filename), frames, size=(900, 721))
+
+
 if __name__ == '__main__':
+    # python day14.py --benchmark-export [frames]
+    if sys.argv[1:2] == ['--benchmark-export']:
+        benchmark_parallel_export(frames=int(sys.argv[2]) if len(sys.argv) > 2 else 500)
+        sys.exit()
     # Animation('Day 14: Sample').run(BathroomSecurity('../inputs/sample14.txt', size=(11, 7)))
     runner = BathroomSecurity('../inputs/day14.txt')
     animation = Animation('Day 14: Restroom Redoubt', size=(900, 721), fps=240)
     animation.run(runner)
+    # Render frames without a window, e.g. to encode a video:
+    # ffmpeg -f rawvideo -pix_fmt rgb24 -s 900x721 -r 60 -i - day14.mp4
+    # Animation(size=(900, 721), headless=True).export(runner, frames=7000, output=sys.stdout.buffer)
+    # Or render them in parallel, see --benchmark-export for how that scales with the number of processes:
+    # factory = partial(BathroomSecurity, '../inputs/day14.txt')
+    # Animation(size=(900, 721), headless=True).export_parallel(factory, frames=7000, output=sys.stdout.buffer)
@@ -7,7 +7,7 @@ from pygame import Vector2
 from animations import Animation, Model, Point
 
 FPS = 200
-TICK_SPEED = 1
+TICK_RATE = FPS  # Robot moves per second
 TILE_SIZE = 16
 
 BACKGROUND = pygame.image.load('assets/Top-Down_Retro_Interior/TopDownHouse_FloorsAndWalls.png')
@@ -39,6 +39,11 @@ class Actor:
     def rect(self):
         return pygame.rect.Rect(Vector2(self.pos).elementwise() * TILE_SIZE, (TILE_SIZE, TILE_SIZE))
 
+    @property
+    def cells(self) -> list[Point]:
+        """The grid cells the actor occupies"""
+        return [self.pos]
+
     @property
     def sprite(self):
         return self._sprite
@@ -50,24 +55,24 @@ class Actor:
     def move(self, direction):
         self.pos += direction
 
-    def check_move(self, direction, others):
+    def check_move(self, direction, index):
         """
+        Find everything that would have to move for this actor to move.
+
         :type direction: Point
-        :type others: list[Actor]
+        :param index: The actor in each occupied cell, as kept by Warehouse
+        :type index: dict[Point, Actor]
+        :return: The actors to move, or an empty list if something is in the way
         """
-        new_pos = self.rect.move(direction)
         result = {self}
-        collided = [
-            o for o in others
-            if o is not self and new_pos.colliderect(o.rect)
-        ]
-        for c in collided:
-            cascade = c.check_move(direction, others)
+        for cell in self.cells:
+            other = index.get(cell + direction)
+            if other is None or other in result:
+                continue
+            cascade = other.check_move(direction, index)
             if not cascade:
                 return []
             result.update(cascade)
-        unique = {id(obj) for obj in result}
-        assert len(result) == len(unique)
         return result
 
     def render(self, surface):
@@ -111,12 +116,16 @@ class WideBox(Box):
     def rect(self):
         return pygame.rect.Rect(Vector2(self.pos).elementwise() * TILE_SIZE, (TILE_SIZE * 2, TILE_SIZE))
 
+    @property
+    def cells(self) -> list[Point]:
+        return [self.pos, self.pos + (1, 0)]
+
 
 class Wall(Actor):
     def __init__(self, pos):
         super().__init__(pos, sprite=BIG_BOX)
 
-    def check_move(self, direction, others):
+    def check_move(self, direction, index):
         return []
 
 
@@ -163,6 +172,7 @@ class Warehouse(Model):
         self.path = path
         self.robot = [o for o in self.objects if isinstance(o, Robot)].pop()
         self.movements = [ch for ch in self.path if ch in move_dir]
+        self.index = self.index_actors()
         self.progress = -1
         self.background = pygame.Surface((1600, 800), pygame.SRCALPHA)
         bg_tile_width = 62
@@ -171,27 +181,44 @@ class Warehouse(Model):
         for x in range(0, self.background.get_width(), bg_tile_width):
             for y in range(0, self.background.get_height(), bg_tile_height):
                 self.background.blit(BACKGROUND, (x, y), background_area)
-        self.animation_speed = TICK_SPEED
-        self.counter = cycle(range(self.animation_speed))
         self.finished = False
 
+    def index_actors(self) -> dict[Point, Actor]:
+        """Map each occupied cell to the actor in it, for finding collisions"""
+        return {cell: obj for obj in self.objects for cell in obj.cells}
+
+    def move_actors(self, actors, delta: Point):
+        """Move actors, keeping the index current"""
+        for actor in actors:
+            for cell in actor.cells:
+                del self.index[cell]
+        for actor in actors:
+            actor.move(delta)
+            for cell in actor.cells:
+                self.index[cell] = actor
+
     def update(self):
-        if next(self.counter) != 0:
-            return
         if not self.finished:
             try:
                 self.progress += 1
                 movement = self.movements[self.progress]
-                print(self.progress)
                 delta = move_dir[movement]
-                moving = self.robot.check_move(delta, self.objects)
-                for actor in moving:
-                    actor.move(delta)
+                moving = self.robot.check_move(delta, self.index)
+                self.move_actors(moving, delta)
             except IndexError:
                 gps = sum(obj.gps for obj in self.objects if isinstance(obj, Box))
                 self.finished = True
                 print(f'Finished! Total GPS: {gps}')
 
+    def snapshot(self):
+        return self.progress, self.finished, [obj.pos for obj in self.objects]
+
+    def restore(self, state):
+        self.progress, self.finished, positions = state
+        for obj, pos in zip(self.objects, positions):
+            obj.pos = pos
+        self.index = self.index_actors()
+
     def render(self, surface: pygame.Surface):
         surface.blit(self.background, (0, 0))
         for obj in self.objects:
@@ -208,7 +235,7 @@ def run(filename, expand=False):
     objects, path = parse(filename, expand=expand)
     model = Warehouse(objects, path)
     size = (1600, 800) if expand else (800, 800)
-    Animation('Day 15: Warehouse Woes', size=size, fps=FPS).run(model)
+    Animation('Day 15: Warehouse Woes', size=size, fps=FPS, tick_rate=TICK_RATE).run(model)
 
 
 small_sample = '''\
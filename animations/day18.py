@@ -3,7 +3,6 @@ import os.path
 import sys
 from collections import deque, defaultdict
 from functools import lru_cache
-from itertools import cycle
 
 import pygame
 
@@ -41,11 +40,12 @@ class Grid(Model):
         self.corruption: set[Point] = set()
         self.last_added: Point = None
         self.size = size
-        self.tick_rate = 3  # Tick every n frames
-        self.counter = cycle(range(self.tick_rate))
         self.path: list[Point] = []
         self.goal = Point(self.size - 1, self.size - 1)
         self.finished = False
+        # Cached background tile size, and tiles changed since the last render (None: all of them)
+        self.tile_size: int | None = None
+        self.changed: set[Point] | None = None
         self.read_points(init_read)
         self.update_path()
         print('Part 1:', len(self.path) - 1)
@@ -59,7 +59,7 @@ class Grid(Model):
                 continue
             seen.add(point)
             if point == self.goal:
-                self.path = [point, *history]
+                self.set_path([point, *history])
                 return
             for diff in [(0, 1), (1, 0), (0, -1), (-1, 0)]:
                 new_x, new_y = new_point = point + diff
@@ -68,8 +68,14 @@ class Grid(Model):
         # No path possible
         self.path = self.flood_fill(Point(0, 0))
         self.finished = True
+        self.changed = None
         print('Part 2:', self.last_added)
 
+    def set_path(self, path: list[Point]):
+        if self.changed is not None:
+            self.changed |= set(self.path) ^ set(path)
+        self.path = path
+
     def flood_fill(self, start):
         seen: set[Point] = set()
         queue = deque([start])
@@ -98,24 +104,66 @@ class Grid(Model):
 
     def read_points(self, n):
         for _ in range(n):
+            if self.changed is not None and self.last_added is not None:
+                self.changed.add(self.last_added)
             self.last_added = next(self.all_points)
             self.corruption.add(self.last_added)
+            if self.changed is not None:
+                self.changed.add(self.last_added)
 
     def update(self):
-        if self.finished or next(self.counter) > 0:
+        if self.finished:
             return
         if self.path:
             self.read_points(1)
-            self.update_path()
+            with self.timer('pathfinding'):
+                self.update_path()
+
+    def tile_rect(self, point: Point) -> pygame.Rect:
+        return pygame.Rect(point.x * self.tile_size, point.y * self.tile_size, self.tile_size, self.tile_size)
+
+    def render_background(self, surface: pygame.Surface) -> bool:
+        self.tile_size = surface.get_height() // self.size
+        self.draw_grid(surface, self.tile_size)
+        return True
+
+    def dirty_rects(self) -> list[pygame.Rect] | None:
+        if self.changed is None:
+            return None
+        return [self.tile_rect(point) for point in self.changed]
+
+    def invalidate(self):
+        self.changed = None
+
+    def draw_grid(self, surface: pygame.Surface, tile_size: int):
+        for i in range(self.size + 1):
+            pygame.draw.line(surface, (255, 0, 0, 25), (0, tile_size * i), (tile_size * self.size, tile_size * i), 1)
+            pygame.draw.line(surface, (255, 0, 0, 25), (tile_size * i, 0), (tile_size * i, tile_size * self.size), 1)
+
+    def draw_tile(self, surface: pygame.Surface, point: Point, on_path: bool):
+        """Redraw a single tile over the cached background"""
+        rect = self.tile_rect(point)
+        if on_path:
+            color = (255, 0, 0) if self.finished else (0, 0, 255)
+            surface.fill(color, rect)
+            # Each tile owns the grid lines along its top and left edges
+            pygame.draw.line(surface, (255, 0, 0, 25), rect.topleft, (rect.right - 1, rect.top), 1)
+            pygame.draw.line(surface, (255, 0, 0, 25), rect.topleft, (rect.left, rect.bottom - 1), 1)
+        if point in self.corruption:
+            surface.blit(byte_sprite(self.tile_size, highlight=point == self.last_added), rect.topleft)
 
     def render(self, surface: pygame.Surface):
+        if self.tile_size is not None:
+            path = set(self.path)
+            for point in (path | self.corruption) if self.changed is None else self.changed:
+                self.draw_tile(surface, point, point in path)
+            self.changed = set()
+            return
         tile_size = surface.get_height() // self.size
         for point in self.path:
             color = (255, 0, 0) if self.finished else (0, 0, 255)
             surface.fill(color, (pygame.Vector2(point).elementwise() * tile_size, (tile_size, tile_size)))
-        for i in range(self.size + 1):
-            pygame.draw.line(surface, (255, 0, 0, 25), (0, tile_size * i), (tile_size * self.size, tile_size * i), 1)
-            pygame.draw.line(surface, (255, 0, 0, 25), (tile_size * i, 0), (tile_size * i, tile_size * self.size), 1)
+        self.draw_grid(surface, tile_size)
         for byte in self.corruption:
             blit_pos = pygame.Vector2(byte).elementwise() * tile_size
             surface.blit(byte_sprite(tile_size, highlight=byte==self.last_added), blit_pos)
@@ -129,7 +177,7 @@ def solve(filename):
         size = 71
         num_points = 1024
     grid = Grid(filename, size, init_read=num_points)
-    Animation(caption='Day 18: RAM Run', fps=240).run(grid)
+    Animation(caption='Day 18: RAM Run', fps=240, tick_rate=80).run(grid)
 
 
 if __name__ == '__main__':
@@ -1,7 +1,6 @@
 from abc import abstractmethod
 from collections import Counter
 from functools import cached_property
-from itertools import cycle
 from typing import Type
 
 import pygame
@@ -65,7 +64,6 @@ class LogicSystem(Model):
     def __init__(self):
         self.labels: dict[str, Label] = {}
         self.gates: list[Gate] = []
-        self.timer = cycle(range(5))
 
     def load(self, filename):
         gates: dict[str, Type[Gate]] = {
@@ -97,19 +95,18 @@ class LogicSystem(Model):
         return self
 
     def update(self):
-        if next(self.timer) == 0:
-            # Pick and update one gate
-            solvable_gates = [
-                gate for gate in self.gates
-                if (
-                        self.labels[gate.a].value is not None and
-                        self.labels[gate.b].value is not None and
-                        self.labels[gate.output].value is None
-                )
-            ]
-            if solvable_gates:
-                gate = solvable_gates.pop()
-                self.labels[gate.output].value = gate.op()
+        # Pick and update one gate
+        solvable_gates = [
+            gate for gate in self.gates
+            if (
+                    self.labels[gate.a].value is not None and
+                    self.labels[gate.b].value is not None and
+                    self.labels[gate.output].value is None
+            )
+        ]
+        if solvable_gates:
+            gate = solvable_gates.pop()
+            self.labels[gate.output].value = gate.op()
 
     @property
     def part1(self):
@@ -175,4 +172,4 @@ class LogicSystem(Model):
 
 if __name__ == '__main__':
     system = LogicSystem().load('../inputs/day24.txt')
-    Animation('Day 24: Crossed Wires').run(system)
+    Animation('Day 24: Crossed Wires', tick_rate=12).run(system)
@@ -1,7 +1,9 @@
+import heapq
 import sys
 from collections import deque
-from collections.abc import Collection
+from collections.abc import Callable, Collection, Iterable
 from enum import Enum
+from typing import Literal, NamedTuple
 
 from animations import Point
 
@@ -34,8 +36,276 @@ def parse_input(filename):
     return start, end, set(maze)
 
 
-def part1(filename):
+type State = tuple[Point, Facing]
+type Moves = Callable[[Point, Facing], Iterable[tuple[State, int]]]
+
+
+def next_states(pos: Point, facing: Facing, maze: Collection[Point]):
+    """
+    Yield each state reachable in a single move from (pos, facing), along with its cost.
+
+    Turns are only considered if they face an open cell, same as part1.
+    """
+    if pos + facing in maze:
+        yield (pos + facing, facing), 1
+    for new_facing in (facing.left(), facing.right()):
+        if pos + new_facing in maze:
+            yield (pos, new_facing), 1000
+
+
+class Corridor(NamedTuple):
+    end: Point
+    facing: Facing
+    cost: int
+    tiles: tuple[Point, ...]
+    # Out to the first corner, turning around there, and back
+    turnaround: 'Corridor | None' = None
+
+
+def compress_maze(start: Point, end: Point, maze: Collection[Point]) -> dict[State, Corridor]:
+    """
+    Collapse corridors (cells with exactly two open neighbors) into weighted edges.
+
+    The nodes of the compressed graph are junctions, dead ends, and the start and
+    end tiles. Each corridor is keyed by the node and facing it is entered from,
+    and keeps the facing it arrives with, its total cost including any turns along
+    the way, and the tiles it covers. A corridor with a corner also keeps the way
+    back to its own node by turning around at that corner, as both turns there
+    face an open cell.
+    """
+    def open_facings(pos):
+        return [f for f in Facing if pos + f in maze]
+
+    nodes = {pos for pos in maze if len(open_facings(pos)) != 2} | {start, end}
+    corridors: dict[State, Corridor] = {}
+    for node in nodes:
+        for exit_facing in open_facings(node):
+            facing = exit_facing
+            pos = node + facing
+            cost = 1
+            tiles = [pos]
+            turnaround = None
+            while pos not in nodes:
+                back = facing.left().left()
+                new_facing = next(f for f in open_facings(pos) if f != back)
+                if new_facing != facing:
+                    if turnaround is None:
+                        turnaround = Corridor(node, exit_facing.left().left(), 2 * cost + 2000, tuple(tiles))
+                    cost += 1000
+                facing = new_facing
+                pos += facing
+                cost += 1
+                tiles.append(pos)
+            corridors[node, exit_facing] = Corridor(pos, facing, cost, tuple(tiles), turnaround)
+    return corridors
+
+
+def next_compressed_states(pos: Point, facing: Facing, corridors: dict[State, Corridor]):
+    """
+    Yield each state reachable in a single move from (pos, facing) on the compressed graph.
+
+    At a node, the reindeer may either follow the corridor ahead, turn around at
+    its first corner, or turn to face any other corridor leaving the node. As in
+    next_states, each turn has to face an open cell, so turning around on the spot
+    is only possible with a corridor to one side.
+    """
+    if (corridor := corridors.get((pos, facing))) is not None:
+        yield (corridor.end, corridor.facing), corridor.cost
+        if corridor.turnaround is not None:
+            yield (corridor.turnaround.end, corridor.turnaround.facing), corridor.turnaround.cost
+    sides = [side for side in (facing.left(), facing.right()) if (pos, side) in corridors]
+    for side in sides:
+        yield (pos, side), 1000
+    back = facing.left().left()
+    if sides and (pos, back) in corridors:
+        yield (pos, back), 2000
+
+
+def shortest_paths(start: Point, moves: Moves):
+    """
+    Run Dijkstra from the start tile, facing east.
+
+    Instead of keeping the paths themselves, only the predecessor states that
+    reached each state at its optimal cost are recorded, so memory is O(states).
+
+    :param moves: Gives the states reachable from a state, and their costs
+    :return: The best score for each state, and its optimal predecessors
+    """
+    scores: dict[State, int] = {(start, Facing.E): 0}
+    predecessors: dict[State, list[State]] = {(start, Facing.E): []}
+    queue: list[tuple[int, Point, Facing]] = [(0, start, Facing.E)]
+    while queue:
+        score, pos, facing = heapq.heappop(queue)
+        if score > scores[pos, facing]:
+            continue
+        for new_state, cost in moves(pos, facing):
+            new_score = score + cost
+            current_score = scores.get(new_state, sys.maxsize)
+            if new_score < current_score:
+                scores[new_state] = new_score
+                predecessors[new_state] = [(pos, facing)]
+                heapq.heappush(queue, (new_score, *new_state))
+            elif new_score == current_score:
+                predecessors[new_state].append((pos, facing))
+    return scores, predecessors
+
+
+def best_end_score(end: Point, scores: dict[State, int]):
+    return min(scores[end, facing] for facing in Facing if (end, facing) in scores)
+
+
+def best_states(end: Point, scores: dict[State, int], predecessors: dict[State, list[State]]):
+    """Walk the predecessor DAG back from the best end states and collect every state visited"""
+    score = best_end_score(end, scores)
+    check = [(end, facing) for facing in Facing if scores.get((end, facing)) == score]
+    seen: set[State] = set(check)
+    while check:
+        state = check.pop()
+        for prev in predecessors[state]:
+            if prev not in seen:
+                seen.add(prev)
+                check.append(prev)
+    return seen
+
+
+def count_best_tiles(end: Point, scores: dict[State, int], predecessors: dict[State, list[State]]):
+    return len({pos for pos, _ in best_states(end, scores, predecessors)})
+
+
+def count_best_compressed_tiles(
+        end: Point,
+        scores: dict[State, int],
+        predecessors: dict[State, list[State]],
+        corridors: dict[State, Corridor],
+):
+    """Same as count_best_tiles, but expands any corridors along the best paths back into tiles"""
+    states = best_states(end, scores, predecessors)
+    tiles = {pos for pos, _ in states}
+    for state in states:
+        for prev in predecessors[state]:
+            if (corridor := corridors.get(prev)) is None:
+                continue
+            for edge in (corridor, corridor.turnaround):
+                if (
+                        edge is not None
+                        and (edge.end, edge.facing) == state
+                        and scores[prev] + edge.cost == scores[state]
+                ):
+                    tiles.update(edge.tiles)
+    return len(tiles)
+
+
+def previous_states(pos: Point, facing: Facing, maze: Collection[Point]):
+    """The reverse of next_states: yield each state that can reach (pos, facing) in one move, and its cost"""
+    if pos - facing in maze:
+        yield (pos - facing, facing), 1
+    if pos + facing in maze:
+        for old_facing in (facing.left(), facing.right()):
+            yield (pos, old_facing), 1000
+
+
+class ReindeerMaze:
+    """
+    A maze whose walls can be toggled one at a time.
+
+    The score of every state is kept up to date after each toggle by repairing
+    only the part of the distance field the edit touched, in the style of
+    Ramalingam and Reps' dynamic shortest path algorithm.
+    """
+
+    def __init__(self, start: Point, end: Point, maze: Collection[Point]):
+        self.start = start
+        self.end = end
+        self.maze = set(maze)
+        self.scores, _ = shortest_paths(start, self.moves)
+
+    @classmethod
+    def from_file(cls, filename):
+        return cls(*parse_input(filename))
+
+    @property
+    def best_score(self):
+        return best_end_score(self.end, self.scores)
+
+    def moves(self, pos: Point, facing: Facing):
+        return next_states(pos, facing, self.maze)
+
+    def states_near(self, pos: Point):
+        """Every state on pos or its neighbors, since those are the only ones whose edges change when pos is toggled"""
+        return [(p, facing) for p in (pos, *(pos + f for f in Facing)) if p in self.maze for facing in Facing]
+
+    def propagate(self, queue: list[tuple[int, Point, Facing]]):
+        """Continue Dijkstra from the queued states, only ever lowering scores"""
+        heapq.heapify(queue)
+        while queue:
+            score, pos, facing = heapq.heappop(queue)
+            if score > self.scores.get((pos, facing), sys.maxsize):
+                continue
+            for new_state, cost in self.moves(pos, facing):
+                if score + cost < self.scores.get(new_state, sys.maxsize):
+                    self.scores[new_state] = score + cost
+                    heapq.heappush(queue, (score + cost, *new_state))
+
+    def remove_wall(self, pos: Point):
+        if pos in self.maze:
+            return
+        self.maze.add(pos)
+        # Opening a cell only adds edges, so scores can only go down. Every new
+        # edge leaves a state on or next to pos, so restarting from those is enough.
+        queue = [(self.scores[state], *state) for state in self.states_near(pos) if state in self.scores]
+        self.propagate(queue)
+
+    def add_wall(self, pos: Point):
+        if pos in (self.start, self.end):
+            raise ValueError(f'Cannot put a wall on {pos}')
+        if pos not in self.maze:
+            return
+        self.maze.remove(pos)
+        for facing in Facing:
+            self.scores.pop((pos, facing), None)
+
+        # Find the states that lost every optimal predecessor. Checking them in
+        # score order guarantees any predecessor that is going to be affected
+        # has already been found.
+        affected: set[State] = set()
+        check = [(self.scores[state], *state) for state in self.states_near(pos) if state in self.scores]
+        heapq.heapify(check)
+        while check:
+            score, *state = heapq.heappop(check)
+            state = tuple(state)
+            if state in affected or state == (self.start, Facing.E):
+                continue
+            if any(
+                    prev not in affected and self.scores.get(prev) == score - cost
+                    for prev, cost in previous_states(*state, self.maze)
+            ):
+                continue
+            affected.add(state)
+            for new_state, cost in self.moves(*state):
+                if self.scores.get(new_state) == score + cost:
+                    heapq.heappush(check, (score + cost, *new_state))
+
+        # Rebuild the affected scores from their unaffected predecessors
+        for state in affected:
+            del self.scores[state]
+        queue = []
+        for state in affected:
+            score = min(
+                (self.scores[prev] + cost for prev, cost in previous_states(*state, self.maze) if prev in self.scores),
+                default=sys.maxsize,
+            )
+            if score < sys.maxsize:
+                self.scores[state] = score
+                queue.append((score, *state))
+        self.propagate(queue)
+
+
+def part1(filename, method: Literal['grid', 'compressed'] = 'compressed'):
     start, end, maze = parse_input(filename)
+    if method == 'compressed':
+        corridors = compress_maze(start, end, maze)
+        scores, _ = shortest_paths(start, lambda pos, facing: next_compressed_states(pos, facing, corridors))
+        return best_end_score(end, scores)
 
     scores: dict[tuple[Point, Facing], int] = {}
     check: deque[tuple[Point, Facing, int]] = deque([(start, Facing.E, 0)])
@@ -54,8 +324,15 @@ def part1(filename):
     return min(s for (pos, _), s in scores.items() if pos == end)
 
 
-def part2(filename):
+def part2(filename, method: Literal['paths', 'predecessors', 'compressed'] = 'compressed'):
     start, end, maze = parse_input(filename)
+    if method == 'compressed':
+        corridors = compress_maze(start, end, maze)
+        scores, predecessors = shortest_paths(start, lambda pos, facing: next_compressed_states(pos, facing, corridors))
+        return count_best_compressed_tiles(end, scores, predecessors, corridors)
+    if method == 'predecessors':
+        scores, predecessors = shortest_paths(start, lambda pos, facing: next_states(pos, facing, maze))
+        return count_best_tiles(end, scores, predecessors)
     type Path = Collection[Point]
 
     scores: dict[tuple[Point, Facing], tuple[int, list[Path]]] = {}
@@ -86,7 +363,26 @@ def part2(filename):
 if __name__ == '__main__':
     assert part1('inputs/sample16.txt') == 7036
     assert part1('inputs/sample16b.txt') == 11048
+    assert part1('inputs/sample16.txt', method='grid') == 7036
+    assert part1('inputs/sample16b.txt', method='grid') == 11048
+    # The start has to be left backwards, which needs two turns at a junction
+    assert part1('inputs/sample16c.txt') == 3005
+    assert part1('inputs/sample16c.txt', method='grid') == 3005
     print('Part 1:', part1('inputs/day16.txt'))
     assert part2('inputs/sample16.txt') == 45
     assert part2('inputs/sample16b.txt') == 64
+    assert part2('inputs/sample16.txt', method='paths') == 45
+    assert part2('inputs/sample16b.txt', method='paths') == 64
+    assert part2('inputs/sample16.txt', method='predecessors') == 45
+    assert part2('inputs/sample16b.txt', method='predecessors') == 64
+    assert part2('inputs/sample16c.txt') == 5
+    assert part2('inputs/sample16c.txt', method='paths') == 5
     print('Part 2:', part2('inputs/day16.txt'))
+    maze = ReindeerMaze.from_file('inputs/sample16.txt')
+    for wall in [Point(3, 11), Point(1, 9), Point(13, 6)]:
+        maze.add_wall(wall)
+        assert maze.scores == ReindeerMaze(maze.start, maze.end, maze.maze).scores
+    for wall in [Point(1, 9), Point(3, 11), Point(13, 6)]:
+        maze.remove_wall(wall)
+        assert maze.scores == ReindeerMaze(maze.start, maze.end, maze.maze).scores
+    assert maze.best_score == 7036
@@ -1,7 +1,17 @@
+import json
 import os.path
 import re
+import sys
+import textwrap
+import time
+from collections import Counter, deque
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from functools import cache
 from itertools import batched
 
+import numpy as np
+
 op_name = ['adv', 'bxl', 'bst', 'jnz', 'bxc', 'out', 'bdv', 'cdv']
 
 
@@ -21,6 +31,118 @@ def translate_program(program: list[int]):
         print(f'{op} {operand}')
 
 
+# Python expressions for each combo operand. Operand 7 is reserved and halts the program.
+combo_exprs = ['0', '1', '2', '3', 'a', 'b', 'c', None]
+
+type CompiledProgram = Callable[[int, int, int], tuple[int, int, int, list[int]]]
+
+
+@cache
+def compile_program(program: tuple[int, ...]) -> CompiledProgram:
+    """
+    Turn a program into a Python function that runs it to completion.
+
+    The program is split into blocks of straight-line code, each starting at
+    address 0 or a jump target and ending at a jnz or the end of the program.
+    Registers live in local variables, and a block is only looked up by address
+    when a jump is taken, instead of decoding every instruction at runtime.
+
+    :return: A function taking the initial registers, and returning the final
+             registers along with the output
+    """
+    blocks: dict[int, list[str]] = {}
+    pending = [0]
+    while pending:
+        start = pending.pop()
+        if start in blocks:
+            continue
+        lines = []
+        ip = start
+        while True:
+            if ip >= len(program):
+                lines.append('return a, b, c, out')
+                break
+            if ip + 1 == len(program):
+                # Only bxc can run without reading its operand
+                if op_name[program[ip]] == 'bxc':
+                    lines.append('b ^= c')
+                lines.append('return a, b, c, out')
+                break
+            op = op_name[program[ip]]
+            operand = program[ip + 1]
+            combo = combo_exprs[operand]
+            if op == 'jnz':
+                lines += ['if a:', f'    ip = {operand}', '    continue', f'ip = {ip + 2}', 'continue']
+                pending += [operand, ip + 2]
+                break
+            if combo is None and op in ('adv', 'bst', 'out', 'bdv', 'cdv'):
+                lines.append('return a, b, c, out')
+                break
+            lines.append({
+                'adv': f'a = a >> {combo}',
+                'bdv': f'b = a >> {combo}',
+                'cdv': f'c = a >> {combo}',
+                'bxl': f'b ^= {operand}',
+                'bst': f'b = {combo} & 7',
+                'bxc': 'b ^= c',
+                'out': f'out.append({combo} & 7)',
+            }[op])
+            ip += 2
+        blocks[start] = lines
+
+    source = ['def program(a, b, c):', '    out = []', '    ip = 0', '    while True:']
+    for i, (start, lines) in enumerate(sorted(blocks.items())):
+        source.append(f'        {"if" if i == 0 else "elif"} ip == {start}:')
+        source.append(textwrap.indent('\n'.join(lines), ' ' * 12))
+    source.append('        else:')
+    source.append('            return a, b, c, out')
+    namespace = {}
+    exec('\n'.join(source), namespace)
+    return namespace['program']
+
+
+@dataclass
+class Trace:
+    """
+    Execution statistics collected by Computer.run_traced
+
+    :param history_size: How many register snapshots to keep, oldest first
+    :param max_steps: Stop the program after this many instructions, if given
+    """
+    history_size: int = 64
+    max_steps: int | None = None
+    steps: int = 0
+    halted: bool = False
+    op_counts: Counter[str] = field(default_factory=Counter)
+    address_counts: Counter[int] = field(default_factory=Counter)
+    history: deque[tuple[int, int, int, int]] = None  # noqa
+
+    def __post_init__(self):
+        if self.history is None:
+            self.history = deque(maxlen=self.history_size)
+
+    def to_dict(self, program: list[int]):
+        return {
+            'steps': self.steps,
+            'halted': self.halted,
+            'budget_exhausted': not self.halted,
+            'op_counts': dict(self.op_counts.most_common()),
+            'hot_instructions': [
+                {
+                    'address': address,
+                    'instruction': f'{op_name[program[address]]} {program[address + 1]}'
+                    if address + 1 < len(program) else op_name[program[address]],
+                    'hits': hits,
+                }
+                for address, hits in self.address_counts.most_common()
+            ],
+            'history': [{'ip': ip, 'a': a, 'b': b, 'c': c} for ip, a, b, c in self.history],
+        }
+
+    def to_json(self, program: list[int], **kwargs):
+        return json.dumps(self.to_dict(program), **kwargs)
+
+
 class Computer:
     def __init__(self, input: str):
         if os.path.exists(input):
@@ -66,7 +188,9 @@ class Computer:
         else:
             raise RuntimeError('Invalid op!')
 
-    def run(self):
+    def run(self, compiled=False):
+        if compiled:
+            return self.run_compiled()
         self.halted = False
         self.instruction_pointer = 0
         self.output = []
@@ -77,6 +201,113 @@ class Computer:
                 self.halted = True
         return self
 
+    def run_traced(self, trace: Trace = None):
+        """
+        Same as run, but records statistics for every instruction executed.
+
+        This is a separate loop so that run pays nothing for tracing.
+        """
+        if trace is None:
+            trace = Trace()
+        self.halted = False
+        self.instruction_pointer = 0
+        self.output = []
+        while trace.max_steps is None or trace.steps < trace.max_steps:
+            ip = self.instruction_pointer
+            registers = self.a, self.b, self.c
+            try:
+                self.run_next_instruction()
+            except IndexError:
+                self.halted = trace.halted = True
+                break
+            trace.steps += 1
+            trace.op_counts[op_name[self.ops[ip]]] += 1
+            trace.address_counts[ip] += 1
+            trace.history.append((ip, *registers))
+        return trace
+
+    def run_compiled(self):
+        program = compile_program(tuple(self.ops))
+        self.a, self.b, self.c, self.output = program(self.a, self.b, self.c)
+        self.halted = True
+        return self
+
+
+def shift_right(values: np.ndarray, shift: np.ndarray):
+    """values >> shift, except that shifting by 64 or more gives 0 instead of wrapping around"""
+    return np.where(shift < 64, values >> np.minimum(shift, np.uint64(63)), np.uint64(0))
+
+
+def run_batch(program: list[int], a, b=0, c=0, max_steps=100_000):
+    """
+    Run a program for many sets of starting registers at once.
+
+    Each lane has its own instruction pointer, so lanes may branch differently
+    at a jnz. On every step, the instruction at each distinct address is applied
+    to all the lanes sitting at that address as an array operation. Registers
+    are uint64, so values of A need to fit in 64 bits.
+
+    :param a: The starting values of A, one per lane
+    :param b: The starting values of B, either one per lane or shared by all of them
+    :param c: The starting values of C, either one per lane or shared by all of them
+    :param max_steps: Give up on lanes still running after this many steps
+    :return: A matrix of outputs and the number of outputs per lane. The output
+             of lane i is outputs[i, :lengths[i]].
+    """
+    a = np.array(a, dtype=np.uint64)
+    b = np.broadcast_to(np.asarray(b, dtype=np.uint64), a.shape).copy()
+    c = np.broadcast_to(np.asarray(c, dtype=np.uint64), a.shape).copy()
+    registers = {4: a, 5: b, 6: c}
+    ip = np.zeros(a.shape, dtype=np.int64)
+    outputs = np.zeros((len(a), len(program)), dtype=np.uint8)
+    lengths = np.zeros(a.shape, dtype=np.int64)
+
+    for _ in range(max_steps):
+        running = np.flatnonzero(ip + 1 < len(program))
+        if not running.size:
+            break
+        for address in np.unique(ip[running]):
+            lanes = running[ip[running] == address]
+            op = op_name[program[address]]
+            operand = program[address + 1]
+            if op == 'jnz':
+                ip[lanes] = np.where(a[lanes] != 0, operand, address + 2)
+                continue
+            if op in ('adv', 'bst', 'out', 'bdv', 'cdv'):
+                if operand == 7:
+                    ip[lanes] = len(program)
+                    continue
+                if operand < 4:
+                    value = np.full(lanes.shape, operand, dtype=np.uint64)
+                else:
+                    value = registers[operand][lanes]
+            if op == 'adv':
+                a[lanes] = shift_right(a[lanes], value)
+            elif op == 'bdv':
+                b[lanes] = shift_right(a[lanes], value)
+            elif op == 'cdv':
+                c[lanes] = shift_right(a[lanes], value)
+            elif op == 'bxl':
+                b[lanes] ^= np.uint64(operand)
+            elif op == 'bst':
+                b[lanes] = value & np.uint64(7)
+            elif op == 'bxc':
+                b[lanes] ^= c[lanes]
+            elif op == 'out':
+                if lengths[lanes].max() >= outputs.shape[1]:
+                    outputs = np.hstack([outputs, np.zeros_like(outputs)])
+                outputs[lanes, lengths[lanes]] = value & np.uint64(7)
+                lengths[lanes] += 1
+            ip[lanes] = address + 2
+    return outputs, lengths
+
+
+def matches_output(outputs: np.ndarray, lengths: np.ndarray, expected: list[int]):
+    """Get a mask of the lanes from run_batch whose output is exactly the expected one"""
+    if outputs.shape[1] < len(expected):
+        return np.zeros(lengths.shape, dtype=bool)
+    return (lengths == len(expected)) & (outputs[:, :len(expected)] == expected).all(axis=1)
+
 
 def test():
     assert Computer('0,0,9 -- 2,6').run().b == 1
@@ -85,32 +316,158 @@ def test():
     assert Computer('2024,0,0 -- 0,1,5,4,3,0').run().a == 0
     assert Computer('0,29,0 -- 1,7').run().b == 26
     assert Computer('0,2024,43690 -- 4,0').run().b == 44354
+    assert Computer('0,0,9 -- 2,6').run(compiled=True).b == 1
+    assert Computer('10,0,0 -- 5,0,5,1,5,4').run(compiled=True).output == [0, 1, 2]
+    assert Computer('2024,0,0 -- 0,1,5,4,3,0').run(compiled=True).output == [4, 2, 5, 6, 7, 7, 7, 7, 3, 1, 0]
+    assert Computer('2024,0,0 -- 0,1,5,4,3,0').run(compiled=True).a == 0
+    assert Computer('0,29,0 -- 1,7').run(compiled=True).b == 26
+    assert Computer('0,2024,43690 -- 4,0').run(compiled=True).b == 44354
+    trace = Computer('2024,0,0 -- 0,1,5,4,3,0').run_traced()
+    assert trace.halted and trace.steps == 33
+    assert trace.op_counts == {'adv': 11, 'out': 11, 'jnz': 11}
+    assert trace.address_counts == {0: 11, 2: 11, 4: 11}
+    trace = Computer('1,0,0 -- 3,0').run_traced(Trace(history_size=3, max_steps=100))
+    assert not trace.halted and trace.steps == 100
+    assert list(trace.history) == [(0, 1, 0, 0)] * 3
+    outputs, lengths = run_batch([0, 1, 5, 4, 3, 0], [2024, 729, 0])
+    assert outputs[0, :lengths[0]].tolist() == [4, 2, 5, 6, 7, 7, 7, 7, 3, 1, 0]
+    assert outputs[1, :lengths[1]].tolist() == [4, 6, 3, 5, 6, 3, 5, 2, 1, 0]
+    assert lengths[2] == 1
+
+
+def profile(filename, max_steps=1_000_000):
+    """Print a JSON profile of a program's run, stopping after max_steps instructions"""
+    computer = Computer(filename)
+    trace = computer.run_traced(Trace(history_size=16, max_steps=max_steps))
+    print(trace.to_json(computer.ops, indent=2))
+
+
+def benchmark(filename, seconds=1.0):
+    """Compare instructions per second of the interpreter and the compiled program"""
+    computer = Computer(filename)
+    a, b, c = computer.a, computer.b, computer.c
+    computer.instruction_pointer = 0
+    computer.halted = False
+    instructions = 0
+    while not computer.halted:
+        try:
+            computer.run_next_instruction()
+            instructions += 1
+        except IndexError:
+            computer.halted = True
+
+    for compiled in (False, True):
+        runs = 0
+        start = time.perf_counter()
+        while (elapsed := time.perf_counter() - start) < seconds:
+            computer.a, computer.b, computer.c = a, b, c
+            computer.run(compiled=compiled)
+            runs += 1
+        name = 'Compiled' if compiled else 'Interpreted'
+        print(f'{name}: {runs * instructions / elapsed:,.0f} instructions/s')
 
 
 def part1(filename):
     return ','.join(map(str, Computer(filename).run().output))
 
 
-def part2(filename):
-    computer = Computer(filename)
+def find_loop_body(program: list[int]) -> tuple[int, ...] | None:
+    """
+    Check whether a program is a single output loop, and get its body if so.
+
+    That means the program ends with the only jnz, jumping back to the start,
+    and the body outputs exactly once, shifts A right by 3 exactly once, and
+    sets B and C before reading them. Each iteration then only depends on the
+    value of A it starts with, and consumes 3 bits of it.
+    """
+    if len(program) % 2 or program[-2:] != [3, 0]:
+        return None
+    body = tuple(program[:-2])
+    written = set()
+    outputs = shifts = 0
+    for opcode, operand in batched(body, 2):
+        op = op_name[opcode]
+        combo = 'abc?'[operand - 4] if operand > 3 else None
+        reads = {
+            'adv': {combo},
+            'bdv': {combo},
+            'cdv': {combo},
+            'bst': {combo},
+            'out': {combo},
+            'bxl': {'b'},
+            'bxc': {'b', 'c'},
+        }.get(op, set()) - {None, 'a'}
+        if op == 'jnz' or '?' in reads or reads - written:
+            return None
+        if op == 'adv':
+            if operand != 3:
+                return None
+            shifts += 1
+        outputs += op == 'out'
+        written.add({'bdv': 'b', 'bxl': 'b', 'bst': 'b', 'bxc': 'b', 'cdv': 'c'}.get(op))
+    if outputs != 1 or shifts != 1:
+        return None
+    return body
+
+
+def find_quine_by_digits(program: list[int], body: tuple[int, ...]):
+    """
+    Build A three bits at a time, starting from the most significant chunk.
+
+    The most significant chunk is the last one left in A, so it has to produce
+    the last output. Each chunk is checked by running one iteration of the loop
+    body, and the search backtracks depth first, trying smaller digits first, so
+    the first solution found is the smallest.
+    """
+    iteration = compile_program(body)
+
+    def search(a, i):
+        if i < 0:
+            return a
+        for digit in range(0o10):
+            value = a * 8 + digit
+            if value and iteration(value, 0, 0)[3] == [program[i]]:
+                if (found := search(value, i - 1)) is not None:
+                    return found
+        return None
+
+    return search(0, len(program) - 1)
+
+
+def find_quine_by_suffix(computer: Computer):
+    """
+    Fallback for programs of any other shape.
+
+    Grow a set of candidates for A one octal digit at a time, keeping each one
+    whose full run outputs a long enough suffix of the program. Each level's
+    candidates are all run together with run_batch.
+    """
     desired_output = computer.ops
 
-    results = [0]
+    results = np.zeros(1, dtype=np.uint64)
     for i in range(len(desired_output)):
-        candidates = range(0o10)
-        new_results = set()
-        for c in candidates:
-            for n in results:
-                value = n * 8 + c
-                computer.a = value
-                computer.b = computer.c = 0
-                result = computer.run().output
-                if not result:
-                    continue
-                if result == desired_output[-i-1:]:
-                    new_results.add(value)
-        results = new_results
-    return min(results)
+        candidates = (results[:, np.newaxis] * 8 + np.arange(0o10, dtype=np.uint64)).ravel()
+        outputs, lengths = run_batch(computer.ops, candidates)
+        results = candidates[matches_output(outputs, lengths, desired_output[-i-1:])]
+    return int(results.min())
+
+
+def find_quine_by_sweep(program: list[int], stop: int, batch_size=1 << 16):
+    """Brute force every value of A below stop, batch_size at a time"""
+    for start in range(0, stop, batch_size):
+        candidates = np.arange(start, min(start + batch_size, stop), dtype=np.uint64)
+        outputs, lengths = run_batch(program, candidates)
+        if (hits := np.flatnonzero(matches_output(outputs, lengths, program))).size:
+            return int(candidates[hits[0]])
+    return None
+
+
+def part2(filename):
+    computer = Computer(filename)
+    body = find_loop_body(computer.ops)
+    if body is not None:
+        return find_quine_by_digits(computer.ops, body)
+    return find_quine_by_suffix(computer)
 
 
 if __name__ == '__main__':
@@ -118,4 +475,9 @@ if __name__ == '__main__':
     assert part1('inputs/sample17a.txt') == '4,6,3,5,6,3,5,2,1,0'
     print('Part 1:', part1('inputs/day17.txt'))
     assert part2('inputs/sample17b.txt') == 117440
+    assert find_quine_by_suffix(Computer('inputs/sample17b.txt')) == 117440
+    assert find_quine_by_sweep(Computer('inputs/sample17b.txt').ops, stop=1 << 18) == 117440
     print('Part 2', part2('inputs/day17.txt'))
+    # python day17.py --benchmark
+    if '--benchmark' in sys.argv[1:]:
+        benchmark('inputs/day17.txt')
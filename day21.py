@@ -1,4 +1,4 @@
-from collections import Counter, defaultdict
+from collections import Counter, defaultdict, deque
 from collections.abc import Collection
 from functools import lru_cache
 from itertools import chain, pairwise, product
@@ -119,19 +119,204 @@ def solve(codes: list[str], num_robots: int) -> int:
     return total
 
 
+DIRECTIONAL_PAIRS = list(product(pad_to_points(DIRECTIONAL_KEYPAD), repeat=2))
+
+type Matrix = list[list[int]]
+
+
+def transition_matrix() -> Matrix:
+    """
+    Encode dir_moves as a matrix over pairs of directional keys.
+
+    Column j counts the pairs of presses that one more robot needs to make
+    for the pair j, so expand_dirpad is a multiplication by this matrix.
+    """
+    index = {pair: i for i, pair in enumerate(DIRECTIONAL_PAIRS)}
+    matrix = [[0] * len(DIRECTIONAL_PAIRS) for _ in DIRECTIONAL_PAIRS]
+    for j, pair in enumerate(DIRECTIONAL_PAIRS):
+        for a, b in pairwise('A' + dir_moves[pair]):
+            matrix[index[a, b]][j] += 1
+    return matrix
+
+
+def vec_mat_mul(vec: list, matrix: Matrix, modulus: int = None):
+    result = [sum(v * row[j] for v, row in zip(vec, matrix)) for j in range(len(matrix[0]))]
+    if modulus is not None:
+        result = [r % modulus for r in result]
+    return result
+
+
+def mat_mul(a: Matrix, b: Matrix, modulus: int = None) -> Matrix:
+    return [vec_mat_mul(row, b, modulus) for row in a]
+
+
+@lru_cache
+def pair_weights(num_robots: int, modulus: int = None, normalize=False):
+    """
+    Get the total presses for each directional pair after num_robots robots, as the
+    column sums of the transition matrix to that power, using repeated squaring.
+
+    With normalize, floats are rescaled after every product, which keeps the
+    relative weights of the pairs without overflowing.
+    """
+    weights = [1.0 if normalize else 1] * len(DIRECTIONAL_PAIRS)
+    power = transition_matrix()
+    n = num_robots
+    while n:
+        if n & 1:
+            weights = vec_mat_mul(weights, power, modulus)
+            if normalize:
+                weights = [w / max(weights) for w in weights]
+        n >>= 1
+        if n:
+            power = mat_mul(power, power, modulus)
+            if normalize:
+                scale = max(map(max, power))
+                power = [[p / scale for p in row] for row in power]
+    return dict(zip(DIRECTIONAL_PAIRS, weights))
+
+
+def solve_by_matrix_power(codes: list[str], num_robots: int, modulus: int = None) -> int:
+    """
+    Same as solve, but all the robots are applied at once with a matrix power.
+
+    With a modulus, the counts are only kept modulo that number, so the numpad
+    solution for each code is picked by comparing normalized float weights instead.
+    """
+    weights = pair_weights(num_robots, modulus)
+    if modulus is not None:
+        approx_weights = pair_weights(num_robots, normalize=True)
+    total = 0
+    for code in codes:
+        solutions = expand_numpad(code)
+        if modulus is None:
+            length = min(sum(weights[pair] * count for pair, count in s.items()) for s in solutions)
+        else:
+            best = min(solutions, key=lambda s: sum(approx_weights[pair] * count for pair, count in s.items()))
+            length = sum(weights[pair] * count for pair, count in best.items()) % modulus
+        num = int(code.rstrip('A').lstrip('0'))
+        total += length * num
+    return total if modulus is None else total % modulus
+
+
+def keypad_paths(before: str, after: str, pad: str) -> set[str]:
+    """
+    Get the button presses that could move a robot between two keys of any keypad,
+    including the final A press.
+
+    Every shortest route that stays on the keys is considered, found by a
+    breadth-first search back from the target key. On the standard pads the
+    best route turns at most once, but other layouts may have gaps that only
+    routes with more turns, or longer ones, can get around.
+
+    :raises ValueError: If the keys aren't connected
+    """
+    pad_points = pad_to_points(pad)
+    keys = set(pad_points.values())
+    steps = {'>': Point(1, 0), '<': Point(-1, 0), 'v': Point(0, 1), '^': Point(0, -1)}
+    # Distance from every key to the target
+    distances = {pad_points[after]: 0}
+    check = deque([pad_points[after]])
+    while check:
+        pos = check.popleft()
+        for step in steps.values():
+            if (new_pos := pos - step) in keys and new_pos not in distances:
+                distances[new_pos] = distances[pos] + 1
+                check.append(new_pos)
+    if pad_points[before] not in distances:
+        raise ValueError(f'No route from {before!r} to {after!r} on keypad:\n{pad}')
+
+    def routes(pos: Point) -> list[str]:
+        if pos == pad_points[after]:
+            return ['A']
+        return [
+            ch + route
+            for ch, step in steps.items()
+            if distances.get(pos + step) == distances[pos] - 1
+            for route in routes(pos + step)
+        ]
+
+    return set(routes(pad_points[before]))
+
+
+type CostTable = dict[tuple[str, str], int]
+
+
+def next_cost_table(pad: str, controller_costs: CostTable) -> CostTable:
+    """
+    Get the cost of moving between each pair of keys on a keypad and pressing the second one,
+    given the cost of each pair of presses on the directional keypad controlling it
+    """
+    keys = pad_to_points(pad)
+    return {
+        (before, after): min(
+            sum(controller_costs[pair] for pair in pairwise('A' + path))
+            for path in keypad_paths(before, after, pad)
+        )
+        for before in keys
+        for after in keys
+    }
+
+
+# Cost tables for each directional keypad layout, indexed by the number of
+# directional keypads between it and the human
+directional_cost_tables: dict[str, list[CostTable]] = {}
+
+
+def directional_costs(depth: int, pad: str = DIRECTIONAL_KEYPAD) -> CostTable:
+    """
+    Get the cost table for a directional keypad with depth more directional keypads
+    between it and the human. A human pressing keys directly pays 1 for each.
+    """
+    tables = directional_cost_tables.setdefault(pad, [{
+        (before, after): 1
+        for before in pad_to_points(pad)
+        for after in pad_to_points(pad)
+    }])
+    while len(tables) <= depth:
+        tables.append(next_cost_table(pad, tables[-1]))
+    return tables[depth]
+
+
+@lru_cache
+def keypad_costs(pad: str, num_robots: int, controller: str = DIRECTIONAL_KEYPAD) -> CostTable:
+    """Get the cost table for any keypad, operated through num_robots directional keypads"""
+    return next_cost_table(pad, directional_costs(num_robots, controller))
+
+
+def solve_by_cost_table(codes: list[str], num_robots: int, pad: str = NUMERIC_KEYPAD) -> int:
+    """Same as solve, but each code's length is a sum of precomputed costs of adjacent key pairs"""
+    costs = keypad_costs(pad, num_robots)
+    total = 0
+    for code in codes:
+        length = sum(costs[pair] for pair in pairwise('A' + code))
+        num = int(code.rstrip('A').lstrip('0'))
+        total += length * num
+    return total
+
+
 def part1(file):
     with open(file) as f:
         codes = f.read().splitlines()
-    return solve(codes, 2)
+    return solve_by_cost_table(codes, 2)
 
 
 def part2(file):
     with open(file) as f:
         codes = f.read().splitlines()
-    return solve(codes, 25)
+    return solve_by_cost_table(codes, 25)
 
 
 if __name__ == '__main__':
     assert part1('inputs/sample21.txt') == 126384
+    with open('inputs/sample21.txt') as f:
+        sample_codes = f.read().splitlines()
+    assert solve(sample_codes, 2) == 126384
+    assert solve_by_cost_table(sample_codes, 25) == solve(sample_codes, 25)
+    # A layout where getting from 1 to 2 has to go around a gap
+    assert keypad_paths('1', '2', '1 2\n345\n 0A') == {'v>>^A'}
+    assert solve_by_matrix_power(sample_codes, 2) == 126384
+    assert solve_by_matrix_power(sample_codes, 25) == solve(sample_codes, 25)
+    assert solve_by_matrix_power(sample_codes, 25, modulus=1_000_000_007) == solve(sample_codes, 25) % 1_000_000_007
     print('Part 1:', part1('inputs/day21.txt'))
     print('Part 2:', part2('inputs/day21.txt'))
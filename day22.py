@@ -1,9 +1,10 @@
 import os.path
-from functools import lru_cache, reduce
+from functools import reduce
 from itertools import pairwise
 
+import numpy as np
+
 
-@lru_cache
 def next_secret(n):
     n = (n ^ (n * 64)) % 16777216
     n = (n ^ (n // 32)) % 16777216
@@ -11,41 +12,150 @@ def next_secret(n):
     return n
 
 
-def get_nth_secret(num, n):
-    for _ in range(n):
-        num = next_secret(num)
-    return num
+# next_secret only shifts and XORs 24-bit values, so it's a linear map over GF(2).
+# A bit matrix is stored as a list of its columns, with column j being the image of bit j.
+type BitMatrix = list[int]
 
+SECRET_MATRIX: BitMatrix = [next_secret(1 << bit) for bit in range(24)]
 
-def part1(data):
+
+def apply_bit_matrix(matrix: BitMatrix, vector: int) -> int:
+    result = 0
+    for column in matrix:
+        if vector & 1:
+            result ^= column
+        vector >>= 1
+    return result
+
+
+def compose_bit_matrices(a: BitMatrix, b: BitMatrix) -> BitMatrix:
+    """The matrix that applies b, then a"""
+    return [apply_bit_matrix(a, column) for column in b]
+
+
+# SECRET_MATRIX raised to each power of two, extended as needed
+secret_matrix_powers: list[BitMatrix] = [SECRET_MATRIX]
+
+
+def get_nth_secret(seed, n):
+    """Jump ahead n secrets by applying the power-of-two matrices for each bit of n"""
+    bit = 0
+    while n >> bit:
+        if bit == len(secret_matrix_powers):
+            secret_matrix_powers.append(compose_bit_matrices(secret_matrix_powers[-1], secret_matrix_powers[-1]))
+        if n >> bit & 1:
+            seed = apply_bit_matrix(secret_matrix_powers[bit], seed)
+        bit += 1
+    return seed
+
+
+def next_secrets(secrets: np.ndarray) -> np.ndarray:
+    """Same as next_secret, for a whole uint32 array of secrets at once"""
+    secrets = (secrets ^ (secrets << 6)) & 0xFFFFFF
+    secrets ^= secrets >> 5
+    secrets ^= (secrets << 11) & 0xFFFFFF
+    return secrets
+
+
+def generate_secrets(seeds: list[int], n: int, block_size=1024):
+    """
+    Advance every buyer's secret n times, with all the buyers in a block moving together.
+
+    Only one block of buyers is held at a time, which bounds the memory used.
+
+    :return: For each block, the final secrets and the buyers' prices after each step
+             (including the initial one), as a (buyers x n+1) matrix
+    """
+    for start in range(0, len(seeds), block_size):
+        secrets = np.array(seeds[start:start + block_size], dtype=np.uint32)
+        prices = np.empty((len(secrets), n + 1), dtype=np.int8)
+        prices[:, 0] = secrets % 10
+        for i in range(1, n + 1):
+            secrets = next_secrets(secrets)
+            prices[:, i] = secrets % 10
+        yield secrets, prices
+
+
+def read_seeds(data):
     if os.path.exists(data):
         with open(data) as f:
             data = f.read()
-    return sum(get_nth_secret(int(num), 2000) for num in data.splitlines())
+    return [int(num) for num in data.splitlines()]
+
+
+def part1(data):
+    return sum(int(secrets.sum(dtype=np.int64)) for secrets, _ in generate_secrets(read_seeds(data), 2000))
+
+
+class SequenceTotals:
+    """
+    Total price each sequence of four price changes would fetch across all buyers.
+
+    Each sequence is encoded as a base-19 number in [0, 19^4), with changes from
+    -9 to 9 as digits, so the totals are one flat array indexed by that number.
+    """
+    NUM_SEQUENCES = 19 ** 4
+
+    def __init__(self):
+        self.totals = np.zeros(self.NUM_SEQUENCES, dtype=np.int64)
+
+    @staticmethod
+    def encode(prices: np.ndarray) -> np.ndarray:
+        """Get the code of the sequence ending at each price from the fifth onward, for each buyer"""
+        digits = np.diff(prices.astype(np.int64), axis=-1) + 9
+        return ((digits[..., :-3] * 19 + digits[..., 1:-2]) * 19 + digits[..., 2:-1]) * 19 + digits[..., 3:]
+
+    @staticmethod
+    def decode(code: int) -> tuple[int, int, int, int]:
+        digits = []
+        for _ in range(4):
+            code, digit = divmod(code, 19)
+            digits.append(digit - 9)
+        return tuple(digits[::-1])
+
+    def add(self, prices: np.ndarray):
+        """
+        Add a (buyers x time) matrix of prices.
+
+        A buyer only sells the first time a sequence shows up, so every code is
+        stamped with its buyer, and only the first occurrence of each stamped code
+        is counted.
+        """
+        codes = self.encode(prices)
+        stamped = (np.arange(len(codes))[:, np.newaxis] * self.NUM_SEQUENCES + codes).ravel()
+        _, first = np.unique(stamped, return_index=True)
+        self.totals += np.bincount(
+            codes.ravel()[first],
+            weights=prices[:, 4:].ravel()[first],
+            minlength=self.NUM_SEQUENCES,
+        ).astype(np.int64)
+
+    def best(self) -> tuple[tuple[int, int, int, int], int]:
+        code = int(self.totals.argmax())
+        return self.decode(code), int(self.totals[code])
+
+    def top(self, k: int) -> list[tuple[tuple[int, int, int, int], int]]:
+        codes = np.argpartition(self.totals, -k)[-k:]
+        codes = codes[np.argsort(self.totals[codes], kind='stable')[::-1]]
+        return [(self.decode(int(code)), int(self.totals[code])) for code in codes]
 
 
 def part2(data):
-    if os.path.exists(data):
-        with open(data) as f:
-            data = f.read()
+    totals = SequenceTotals()
+    for _, prices in generate_secrets(read_seeds(data), 2000):
+        totals.add(prices)
+    _, bananas = totals.best()
+    return bananas
 
-    def gen_secrets(seed):
-        value = int(seed)
-        yield value
-        while True:
-            value = next_secret(value)
-            yield value
 
+def part2_by_dicts(data):
     buyers = []
-    for init_secret in data.splitlines():
-        print('.', end='')
-        secrets = gen_secrets(init_secret)
-        secret_history = [next(secrets) for _ in range(2001)]
-        prices = [secret % 10 for secret in secret_history]
-        diffs = [b - a for a, b in pairwise(prices)]
-        diff_seqs = list(zip(diffs, diffs[1:], diffs[2:], diffs[3:]))
-        price_per_seq = dict(list(zip(diff_seqs, prices[4:]))[::-1])
-        buyers.append(price_per_seq)
+    for _, block_prices in generate_secrets(read_seeds(data), 2000):
+        for prices in block_prices.tolist():
+            diffs = [b - a for a, b in pairwise(prices)]
+            diff_seqs = list(zip(diffs, diffs[1:], diffs[2:], diffs[3:]))
+            price_per_seq = dict(list(zip(diff_seqs, prices[4:]))[::-1])
+            buyers.append(price_per_seq)
     all_sequences = reduce(set.union, buyers, set())
     return max(
         sum(buyer.get(seq, 0) for buyer in buyers)
@@ -55,6 +165,15 @@ def part2(data):
 
 if __name__ == '__main__':
     assert part1('1\n10\n100\n2024') == 37327623
+    assert sum(get_nth_secret(num, 2000) for num in [1, 10, 100, 2024]) == 37327623
+    assert get_nth_secret(123, 10) == 5908254
+    assert get_nth_secret(123, 16777215) == 123
     print('Part 1:', part1('inputs/day22.txt'))
     assert part2('1\n2\n3\n2024') == 23
+    assert part2_by_dicts('1\n2\n3\n2024') == 23
+    sample_totals = SequenceTotals()
+    for _, sample_prices in generate_secrets([1, 2, 3, 2024], 2000):
+        sample_totals.add(sample_prices)
+    assert sample_totals.best() == ((-2, 1, -1, 3), 23)
+    assert sample_totals.top(1) == [sample_totals.best()]
     print('Part 2:', part2('inputs/day22.txt'))
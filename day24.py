@@ -1,4 +1,7 @@
-from typing import Callable, Collection
+import random
+from collections import defaultdict, deque
+from itertools import product
+from typing import Callable, Collection, Iterable
 
 type GateMap = dict[str, tuple[Callable[[int, int], int], Collection[str]]]
 
@@ -35,9 +38,199 @@ def solve_system(labels, gates: GateMap):
     return [labels[z] for z in sorted(required)]
 
 
+class CircuitPlan:
+    """
+    The gates of a circuit, ordered once so that each gate comes after every gate feeding it.
+
+    The order is found with Kahn's algorithm, after which any assignment of
+    input wires can be evaluated in a single pass over the gates.
+    """
+
+    def __init__(self, gates: GateMap):
+        dependents: dict[str, list[str]] = defaultdict(list)
+        waiting: dict[str, int] = {}
+        for output, (_, inputs) in gates.items():
+            waiting[output] = 0
+            for wire in inputs:
+                if wire in gates:
+                    dependents[wire].append(output)
+                    waiting[output] += 1
+        ready = deque(output for output, count in waiting.items() if count == 0)
+        self.steps: list[tuple[str, Callable[[int, int], int], str, str]] = []
+        while ready:
+            output = ready.popleft()
+            op, (a, b) = gates[output]
+            self.steps.append((output, op, a, b))
+            for dependent in dependents[output]:
+                waiting[dependent] -= 1
+                if waiting[dependent] == 0:
+                    ready.append(dependent)
+        if len(self.steps) < len(gates):
+            stuck = sorted(output for output, count in waiting.items() if count)
+            raise ValueError(f'Circuit has a cycle among {", ".join(stuck)}')
+        self.outputs = sorted(output for output in gates if output.startswith('z'))
+        self.inputs = sorted({wire for _, inputs in gates.values() for wire in inputs} - gates.keys())
+
+    def evaluate(self, labels: dict[str, int]) -> dict[str, int]:
+        values = labels.copy()
+        for output, op, a, b in self.steps:
+            values[output] = op(values[a], values[b])
+        return values
+
+    def solve(self, labels: dict[str, int]) -> list[int]:
+        """Same as solve_system"""
+        values = self.evaluate(labels)
+        return [values[z] for z in self.outputs]
+
+
+def slice_bits(numbers: list[int], width: int) -> list[int]:
+    """
+    Transpose numbers into bit slices.
+
+    Slice i holds bit i of every number, with bit k of the slice coming from numbers[k].
+    """
+    slices = [0] * width
+    for k, number in enumerate(numbers):
+        for i in range(width):
+            if number >> i & 1:
+                slices[i] |= 1 << k
+    return slices
+
+
+def slice_additions(plan: CircuitPlan, pairs: Collection[tuple[int, int]]) -> tuple[dict[str, int], dict[str, int]]:
+    """
+    Bit-slice (x, y) pairs into the adder's input wires, and x + y into its output wires.
+
+    :return: The input labels and the expected value of each z-wire
+    """
+    width = len([wire for wire in plan.inputs if wire.startswith('x')])
+    xs, ys = zip(*pairs)
+    labels = {
+        **{f'x{i:02}': s for i, s in enumerate(slice_bits(xs, width))},
+        **{f'y{i:02}': s for i, s in enumerate(slice_bits(ys, width))},
+    }
+    expected = dict(zip(plan.outputs, slice_bits([x + y for x, y in pairs], len(plan.outputs))))
+    return labels, expected
+
+
+def check_additions(plan: CircuitPlan, pairs: Iterable[tuple[int, int]]) -> dict[str, int]:
+    """
+    Evaluate an adder circuit on many (x, y) pairs at once, and compare it against x + y.
+
+    Every wire holds a bit-sliced int, where bit k is the wire's value for pairs[k],
+    so a single pass over the gates evaluates every pair, since the gates' ops
+    work bitwise on ints of any size.
+
+    :return: The number of pairs each disagreeing z-wire got wrong
+    """
+    labels, expected = slice_additions(plan, list(pairs))
+    values = plan.evaluate(labels)
+    return {
+        z: errors.bit_count()
+        for z, expected_slice in expected.items()
+        if (errors := values[z] ^ expected_slice)
+    }
+
+
+def random_pairs(width: int, count: int, seed=None) -> list[tuple[int, int]]:
+    rng = random.Random(seed)
+    return [(rng.getrandbits(width), rng.getrandbits(width)) for _ in range(count)]
+
+
+def exhaustive_pairs(width: int) -> list[tuple[int, int]]:
+    """Every pair of width-bit numbers, only practical for small widths"""
+    return list(product(range(1 << width), repeat=2))
+
+
+def gate_name(op: Callable[[int, int], int]) -> str:
+    return op.__name__[2:-2].upper()
+
+
+class GateIndex:
+    """Lookups from (op, input wire) to the gates reading it, and from a wire to every gate it feeds"""
+
+    def __init__(self, gates: GateMap):
+        self.by_op_input: dict[tuple[str, str], set[str]] = defaultdict(set)
+        self.fanout: dict[str, set[str]] = defaultdict(set)
+        for output, (op, inputs) in gates.items():
+            for wire in inputs:
+                self.by_op_input[gate_name(op), wire].add(output)
+                self.fanout[wire].add(output)
+
+    def cone(self, wires: Iterable[str]) -> set[str]:
+        """Get the given wires and every wire downstream of them"""
+        cone = set(wires)
+        check = list(cone)
+        while check:
+            for output in self.fanout.get(check.pop(), ()):
+                if output not in cone:
+                    cone.add(output)
+                    check.append(output)
+        return cone
+
+
+class SwapVerifier:
+    """
+    Check candidate sets of output swaps against an adder's expected sums.
+
+    The circuit is evaluated once, bit-sliced over all the test pairs. After
+    that, a candidate only re-evaluates the fan-out cone of its swapped wires,
+    since nothing else can change.
+    """
+
+    def __init__(self, gates: GateMap, pairs: Iterable[tuple[int, int]]):
+        self.gates = gates
+        self.index = GateIndex(gates)
+        plan = CircuitPlan(gates)
+        labels, self.expected = slice_additions(plan, list(pairs))
+        self.values = plan.evaluate(labels)
+        self.outputs = plan.outputs
+
+    def check(self, swaps: Collection[tuple[str, str]]) -> dict[str, int] | None:
+        """
+        Apply the swaps and count the pairs each disagreeing z-wire gets wrong, same as check_additions.
+
+        :return: The errors per z-wire, or None if the swaps create a cycle
+        """
+        drivers = {}
+        for a, b in swaps:
+            drivers[a] = self.gates[b]
+            drivers[b] = self.gates[a]
+        cone = self.index.cone(drivers)
+
+        # Kahn's algorithm again, but only over the gates in the cone
+        waiting: dict[str, int] = {}
+        dependents: dict[str, list[str]] = defaultdict(list)
+        for output in cone:
+            _, inputs = drivers.get(output) or self.gates[output]
+            waiting[output] = 0
+            for wire in inputs:
+                if wire in cone:
+                    dependents[wire].append(output)
+                    waiting[output] += 1
+        ready = deque(output for output, count in waiting.items() if count == 0)
+        values = {}
+        while ready:
+            output = ready.popleft()
+            op, (a, b) = drivers.get(output) or self.gates[output]
+            values[output] = op(values.get(a, self.values[a]), values.get(b, self.values[b]))
+            for dependent in dependents[output]:
+                waiting[dependent] -= 1
+                if waiting[dependent] == 0:
+                    ready.append(dependent)
+        if len(values) < len(cone):
+            return None
+
+        return {
+            z: errors.bit_count()
+            for z in self.outputs
+            if (errors := values.get(z, self.values[z]) ^ self.expected[z])
+        }
+
+
 def part1(input):
     labels, gates = parse(input)
-    result = solve_system(labels, gates)
+    result = CircuitPlan(gates).solve(labels)
     return sum(value << i for i, value in enumerate(result))
 
 
@@ -45,23 +238,22 @@ def part2(input):
     labels, gates_by_output = parse(input)
     gates_by_input: dict[tuple[str, str], dict[str, str]] = {}
     for output, (op, inputs) in gates_by_output.items():
-        op_name = op.__name__[2:-2].upper()
         a, b = sorted(inputs)
-        gates_by_input.setdefault((a, b), {})[op_name] = output
+        gates_by_input.setdefault((a, b), {})[gate_name(op)] = output
+    index = GateIndex(gates_by_output)
 
     swaps: dict[str, str] = {}  # At the end, this should have 8 entries, with 4 of them being reverses of the other 4
     detected_carries: dict[str, str] = {}
 
     def find_gate(op: str, expected_inputs: Collection[str], expected_output: str):
-        matching_gates = [
-            (inputs, output)
-            for inputs, gates in gates_by_input.items()
-            for op_name, output in gates.items()
-            if op_name == op and (
-                    output == expected_output
-                    or (set(inputs) & set(expected_inputs))
-            )
-        ]
+        outputs = {
+            output
+            for wire in expected_inputs
+            for output in index.by_op_input.get((op, wire), ())
+        }
+        if expected_output in gates_by_output and gate_name(gates_by_output[expected_output][0]) == op:
+            outputs.add(expected_output)
+        matching_gates = [(tuple(sorted(gates_by_output[output][1])), output) for output in outputs]
         assert len(matching_gates) == 1
         return matching_gates[0]
 
@@ -166,10 +358,30 @@ def part2(input):
     # Final carry should be the final z
     last_carry = max(detected_carries)
     assert detected_carries[last_carry] == last_carry.replace('c', 'z')
+    swap_pairs = {tuple(sorted(pair)) for pair in swaps.items()}
+    assert SwapVerifier(gates_by_output, random_pairs(len(result_wires) - 1, 256, seed=0)).check(swap_pairs) == {}
     return ','.join(sorted(swaps))
 
 
 if __name__ == '__main__':
     assert part1('inputs/sample24.txt') == 2024
+    sample_labels, sample_gates = parse('inputs/sample24.txt')
+    assert CircuitPlan(sample_gates).solve(sample_labels) == solve_system(sample_labels, sample_gates)
+    bad_adder = CircuitPlan({
+        'z00': (int.__xor__, {'x00', 'y00'}),
+        'z01': (int.__or__, {'x00', 'y00'}),  # Should be AND
+    })
+    assert check_additions(bad_adder, exhaustive_pairs(1)) == {'z01': 2}
+    half_adder = CircuitPlan({
+        'z00': (int.__xor__, {'x00', 'y00'}),
+        'z01': (int.__and__, {'x00', 'y00'}),
+    })
+    # Any iterable of pairs works, even one that can only be read once
+    assert check_additions(half_adder, iter(exhaustive_pairs(1))) == {}
+    try:
+        CircuitPlan({'a': (int.__and__, {'x', 'b'}), 'b': (int.__or__, {'a', 'y'})})
+        assert False, 'Cycle not detected'
+    except ValueError:
+        pass
     print('Part 1:', part1('inputs/day24.txt'))
     print('Part 2:', part2('inputs/day24.txt'))